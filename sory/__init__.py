@@ -3,9 +3,11 @@ import os
 from flask import Flask
 
 
-def create_app(test_config=None):
+def create_app(test_config=None, instance_path=None):
     # create and configure the app
-    app = Flask(__name__, instance_relative_config=True)
+    app = Flask(
+        __name__, instance_path=instance_path, instance_relative_config=True
+    )
     app.config.from_mapping(SECRET_KEY="dev")
 
     if test_config is None:
@@ -37,4 +39,31 @@ def create_app(test_config=None):
 
     app.register_blueprint(ctrlr.bp)
 
+    # instrumentation
+    from . import metrics
+
+    metrics.init_app(app)
+
+    # rendered board pages
+    from . import pagecache
+
+    pagecache.init_app(app)
+
+    # opt-in profiling of sampled or slow requests
+    from . import profiler
+
+    profiler.init_app(app)
+
+    # repository upkeep
+    from . import maint
+
+    maint.init_app(app)
+
+    # the repo and indexes open on first use, unless asked for up front
+    if app.config.get("SORY_PRELOAD"):
+        from . import model
+
+        with app.app_context():
+            model.preload()
+
     return app
@@ -0,0 +1,249 @@
+"""
+ASGI serving mode.
+
+    uvicorn --factory sory.asgi:create_asgi_app
+
+The event loop holds the connections, and the same Flask app (model,
+convert and all) runs on a small bounded thread pool, so slow git
+commits tie up a pool thread and not a connection. When the pool and
+its queue are full, new requests get a 503 right away instead of
+piling up: SORY_ASGI_THREADS sizes the pool, SORY_ASGI_QUEUE the number
+of requests allowed to wait for it.
+
+/events is served on the loop itself, with no thread at all: a
+server-sent event every time the write generation moves, so thousands of
+mostly idle watchers cost a coroutine each.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import sys
+
+from flask import Flask
+
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+defaults = {
+    "SORY_ASGI_THREADS": 8,
+    "SORY_ASGI_QUEUE": 64,
+    "SORY_EVENTS_POLL": 0.25,
+    "SORY_EVENTS_KEEPALIVE": 15.0,
+}
+
+
+def _environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin1"),
+        "PATH_INFO": scope["path"].encode().decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope["headers"]:
+        name = raw_name.decode("latin1").upper().replace("-", "_")
+        value = raw_value.decode("latin1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        if name in environ:
+            value = f"{environ[name]},{value}"
+        environ[name] = value
+    return environ
+
+
+def _call_wsgi(
+    app: Callable, environ: Dict[str, Any]
+) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    """Runs on a pool thread. Buffers the whole response."""
+    started: List[Any] = []
+    chunks: List[bytes] = []
+
+    def start_response(status: str, headers: List, exc_info=None):
+        started[:] = [status, headers]
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    status, headers = started
+    return (
+        int(status.split(" ", 1)[0]),
+        [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers],
+        b"".join(chunks),
+    )
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _respond(
+    send: Send, status: int, headers: List[Tuple[bytes, bytes]], body: bytes
+) -> None:
+    await send(
+        {"type": "http.response.start", "status": status, "headers": headers}
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class bridge:
+    def __init__(
+        self,
+        wsgi_app: Callable,
+        threads: int,
+        queue: int,
+        generation: Optional[Callable[[], int]] = None,
+        poll: float = defaults["SORY_EVENTS_POLL"],
+        keepalive: float = defaults["SORY_EVENTS_KEEPALIVE"],
+    ) -> None:
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.limit = threads + queue
+        self.outstanding = 0
+        self.generation = generation
+        self.poll = poll
+        self.keepalive = keepalive
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix="sory")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] != "http":
+            return  # no websockets here
+        elif scope["path"] == "/events" and self.generation is not None:
+            await self.events(receive, send)
+        else:
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.pool.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # single-threaded loop, so a plain counter will do
+        if self.outstanding >= self.limit:
+            await _respond(
+                send,
+                503,
+                [(b"content-type", b"text/plain"), (b"retry-after", b"1")],
+                b"Too busy, sorry.",
+            )
+            return
+
+        self.outstanding += 1
+        try:
+            body = await _read_body(receive)
+            loop = asyncio.get_running_loop()
+            status, headers, content = await loop.run_in_executor(
+                self.pool, _call_wsgi, self.wsgi_app, _environ(scope, body)
+            )
+        finally:
+            self.outstanding -= 1
+        await _respond(send, status, headers, content)
+
+    async def events(self, receive: Receive, send: Send) -> None:
+        gone = asyncio.Event()
+
+        async def watch_disconnect() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            gone.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"text/event-stream"),
+                        (b"cache-control", b"no-cache"),
+                    ],
+                }
+            )
+            loop = asyncio.get_running_loop()
+            seen = None
+            quiet_since = loop.time()
+            while not gone.is_set():
+                now = self.generation()
+                if now != seen:
+                    seen, quiet_since = now, loop.time()
+                    chunk = f"event: generation\ndata: {now}\n\n"
+                elif loop.time() - quiet_since >= self.keepalive:
+                    quiet_since = loop.time()
+                    chunk = ": still here\n\n"
+                else:
+                    chunk = None
+                if chunk:
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk.encode(),
+                            "more_body": True,
+                        }
+                    )
+                try:
+                    await asyncio.wait_for(gone.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            watcher.cancel()
+
+
+def create_asgi_app(test_config=None, instance_path=None) -> bridge:
+    from . import create_app
+
+    app: Flask = create_app(test_config, instance_path=instance_path)
+
+    def config(key: str) -> Any:
+        return app.config.get(key, defaults[key])
+
+    with app.app_context():
+        from . import model
+
+        generation = model.generation
+
+    return bridge(
+        app,
+        threads=config("SORY_ASGI_THREADS"),
+        queue=config("SORY_ASGI_QUEUE"),
+        generation=lambda: generation.value,
+        poll=config("SORY_EVENTS_POLL"),
+        keepalive=config("SORY_EVENTS_KEEPALIVE"),
+    )
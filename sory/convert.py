@@ -2,11 +2,13 @@ from typing import NamedTuple, Union, Iterable, List, Type, TypeVar, Optional
 import itertools
 import re
 
+from .metrics import convert_seconds, convert_tokens, timed_generator
+
 
 # -- helper library
 
 
-T = TypeVar["T"]
+T = TypeVar("T")
 
 
 def unpeek(head: T, tail: Iterable[T]) -> Iterable[T]:
@@ -18,6 +20,7 @@ def unpeek(head: T, tail: Iterable[T]) -> Iterable[T]:
 
 class Meta(NamedTuple):
     delim = "---"
+    kv_delim = ":"
     meta: dict
 
 
@@ -100,9 +103,13 @@ whitespace = re.compile("\s")
 word_boundary = re.compile(f"[\s{Star.lit}{Under.lit}{Backtick.lit}]")
 
 
+@timed_generator(convert_seconds, convert_tokens, stage="lex")
 def lex(lines: Iterable[str]) -> Iterable[Lex]:
     # check first line for indentation
-    first_line = next(lines)
+    lines = iter(lines)
+    first_line = next(lines, None)
+    if first_line is None:
+        return
     m = whitespace.match(first_line)
     assert not m or m.start
 
@@ -114,8 +121,8 @@ def lex(lines: Iterable[str]) -> Iterable[Lex]:
                 break
             else:
                 assert Meta.kv_delim in line
-                key, value = line.split(Meta.kv_delim)
-                meta[key] = value
+                key, value = line.split(Meta.kv_delim, 1)
+                meta[key.strip()] = value.strip()
         yield Meta(meta)
     else:
         # in the other branch, meta consumes first line
@@ -145,7 +152,7 @@ def lex(lines: Iterable[str]) -> Iterable[Lex]:
             for list_class in (Bullet, Checkedbox, Uncheckedbox)
         ):
             m = whitespace.search(line)
-            if m and m.start == 0:
+            if m and m.start() == 0:
                 n_spaces += 1
                 line = line[1:]
             else:
@@ -174,10 +181,13 @@ def lex(lines: Iterable[str]) -> Iterable[Lex]:
         assert indentation[-1] == n_spaces
 
         # headers
+        n_pounds = 0
         while line.startswith(Pound.lit):
             assert n_spaces == 0
-            yield Pound()
+            n_pounds += 1
             line = line[len(Pound.lit) :]
+        if n_pounds:
+            yield Pound(n_pounds)
 
         # code block fence
         # this guy consumes the whole line
@@ -207,8 +217,8 @@ def lex(lines: Iterable[str]) -> Iterable[Lex]:
             if line == stripped:
                 match = word_boundary.search(line)
                 if match:
-                    yield Word(line[: match.start])
-                    line = line[match.start :]
+                    yield Word(line[: match.start()])
+                    line = line[match.start() :]
                 else:
                     yield Word(line)
                     line = ""
@@ -220,6 +230,61 @@ def lex(lines: Iterable[str]) -> Iterable[Lex]:
         yield Newline()
 
 
+def front_matter(text: str) -> dict:
+    """A card's `Meta` block, lexing no further than its end."""
+    first = next(lex(text.splitlines()), None)
+    return first.meta if isinstance(first, Meta) else {}
+
+
+class Preview(NamedTuple):
+    title: Optional[str]
+    text: str
+    done: int
+    total: int
+
+
+def preview(text: str, n_chars: int) -> Preview:
+    """
+    The first header, the first `n_chars` of text with the markup taken
+    out, and how many checkboxes are checked out of how many.
+    """
+    title = None
+    in_title = False
+    words: List[str] = []
+    done = total = 0
+    n = 0
+
+    tokens = lex(text.splitlines())
+    while True:
+        try:
+            tok = next(tokens)
+        except StopIteration:
+            break
+        except AssertionError:
+            break  # the lexer gave up. what we have so far will do.
+
+        if isinstance(tok, (Checkedbox, Uncheckedbox)):
+            total += 1
+            done += isinstance(tok, Checkedbox)
+        elif isinstance(tok, Pound) and title is None:
+            title, in_title = "", True
+        elif isinstance(tok, (Word, Blank)):
+            if in_title:
+                title += tok.lit
+            elif n < n_chars:
+                words.append(tok.lit)
+                n += len(tok.lit)
+        elif isinstance(tok, Newline):
+            if in_title:
+                in_title = False
+            elif n < n_chars and words and words[-1] != " ":
+                words.append(" ")
+                n += 1
+
+    snippet = " ".join("".join(words).split())[:n_chars]
+    return Preview(title.strip() if title else title, snippet, done, total)
+
+
 # -- parser
 
 # grammar
@@ -297,12 +362,12 @@ class Checklist(NamedTuple):
     items: List[Check]
 
 
-class Bullet(NamedTuple):
+class BulletItem(NamedTuple):
     stuff: List[Block]
 
 
 class BulletList(NamedTuple):
-    items: List[Bullet]
+    items: List[BulletItem]
 
 
 class Header(NamedTuple):
@@ -332,6 +397,7 @@ def get_raw_until(delim_type: Type[Lex], lexes: Iterable[Lex]):
 span_delim = [(Code, Backtick), (Strong, Star), (Em, Under)]
 
 
+@timed_generator(convert_seconds, convert_tokens, stage="parse")
 def parse(lexes: Iterable[Lex]) -> Iterable[Top]:
 
     # -- iterator combinators, relying on late-binding nonlocals
@@ -410,12 +476,7 @@ def parse(lexes: Iterable[Lex]) -> Iterable[Top]:
 
     def parse_header(cur: Lex, lexes: Iterable[Lex]) -> Header:
         assert isinstance(cur, Pound)
-        level = 1
-        cur = next(lexes)
-        while isinstance(cur, Pound):
-            level += 1
-            cur = next(lexes)
-        return Header(level, parse_text(cur, lexes))
+        return Header(cur.num, parse_text(next(lexes), lexes))
 
     for cur in lexes:
         if isinstance(cur, Meta):
@@ -2,10 +2,10 @@ from flask import (
     Blueprint,
     redirect,
     request,
-    url_for,
-    render_template,  # flash, g, ,
+    url_for,  # flash, g, ,
 )
 from . import model
+from .metrics import render_template
 
 
 POST = ("POST",)
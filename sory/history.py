@@ -0,0 +1,153 @@
+"""
+Path -> commits index, so a card's history doesn't cost a walk over the
+whole commit graph.
+
+Each repo gets an append-only log with a `<sha> <path>` line for every
+path a commit touched, oldest first. commit_txn appends to it as it
+commits, and the first lookup backfills it from existing history. If its
+last sha ever stops matching what the new commit's parent was (somebody
+committed behind our back, or maintenance rewrote history) it's rebuilt
+from scratch.
+
+Readers keep the parsed log in memory and only read what got appended
+since last time. They only ever run git as a fresh subprocess: GitPython
+object lookups go through one cat-file pipe per repo, which doesn't
+survive being used by several threads at once.
+"""
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from datetime import datetime
+import os
+from os.path import exists
+import threading
+
+from .metrics import cache_total
+
+if TYPE_CHECKING:
+    import git
+
+
+class Revision(NamedTuple):
+    sha: str
+    date: datetime
+    message: str
+    diff: str
+
+
+# log path -> (inode, bytes read, path -> shas oldest first)
+_cache: Dict[str, Tuple[int, int, Dict[str, List[str]]]] = {}
+_cache_lock = threading.Lock()
+
+
+def _tip(log_path: str) -> Optional[str]:
+    if not exists(log_path) or not os.path.getsize(log_path):
+        return None
+    with open(log_path, "rb") as log:
+        log.seek(max(0, os.path.getsize(log_path) - 256))
+        return log.read().splitlines()[-1].split(b" ", 1)[0].decode()
+
+
+def _lines(sha: str, paths: List[str]) -> str:
+    return "".join(f"{sha} {p}\n" for p in paths)
+
+
+def rebuild(repo: "git.Repo", log_path: str) -> None:
+    """Backfill from the repo's history. Hold the writer lock."""
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    chunks = []
+    if repo.head.is_valid():
+        # one git call for all of history. NUL marks each commit.
+        out = repo.git.log(
+            "--reverse", "--no-renames", "--format=%x00%H", "--name-only"
+        )
+        for commit in out.split("\0")[1:]:
+            sha, *paths = commit.split("\n")
+            chunks.append(_lines(sha, [p for p in paths if p]))
+    tmp = f"{log_path}.tmp"
+    with open(tmp, "w") as log:
+        log.writelines(chunks)
+    os.replace(tmp, log_path)
+
+
+def record(repo: "git.Repo", log_path: str, commit: "git.Commit") -> None:
+    """Note a fresh commit. Hold the writer lock."""
+    parent = commit.parents[0].hexsha if commit.parents else None
+    if not exists(log_path) or _tip(log_path) != parent:
+        rebuild(repo, log_path)
+        return
+    paths = repo.git.diff_tree(
+        "--no-commit-id",
+        "--no-renames",
+        "--name-only",
+        "-r",
+        "--root",
+        commit.hexsha,
+    ).splitlines()
+    with open(log_path, "a") as log:
+        log.write(_lines(commit.hexsha, paths))
+
+
+def _index(log_path: str) -> Dict[str, List[str]]:
+    # or two readers would both append what they read to the same index
+    with _cache_lock:
+        return _load_index(log_path)
+
+
+def _load_index(log_path: str) -> Dict[str, List[str]]:
+    inode, offset, index = _cache.get(log_path, (None, 0, {}))
+    st = os.stat(log_path)
+    if st.st_ino != inode or st.st_size < offset:
+        # rebuilt under us, start over
+        offset, index = 0, {}
+    if st.st_size == offset:
+        cache_total.inc(cache="history", result="hit")
+    else:
+        cache_total.inc(cache="history", result="miss")
+        with open(log_path, "r") as log:
+            log.seek(offset)
+            for line in log:
+                if not line.endswith("\n"):
+                    break  # a writer is mid-append, get it next time
+                offset += len(line.encode())
+                sha, path = line[:-1].split(" ", 1)
+                index.setdefault(path, []).append(sha)
+    _cache[log_path] = (st.st_ino, offset, index)
+    return index
+
+
+def count(log_path: str, path: str) -> int:
+    return len(_index(log_path).get(path, ()))
+
+
+def revisions(
+    repo: "git.Repo", log_path: str, path: str, start: int, n: int
+) -> List[Revision]:
+    """`n` revisions of repo-relative `path`, newest first, from `start`."""
+    shas = _index(log_path).get(path, [])
+    page = shas[::-1][start : start + n]
+    if not page:
+        return []
+    # the whole page in one git call. NUL ends each field.
+    out = repo.git.log(
+        "--no-walk=unsorted",
+        "--format=%x00%H%x00%cI%x00%B%x00",
+        "-p",
+        *page,
+        "--",
+        path,
+    )
+    fields = out.split("\0")[1:]
+    found = {}
+    for i in range(0, len(fields), 4):
+        sha, date, message, diff = fields[i : i + 4]
+        found[sha] = Revision(
+            sha, datetime.fromisoformat(date), message, diff.strip("\n")
+        )
+    return [found[sha] for sha in page if sha in found]
@@ -0,0 +1,314 @@
+"""
+How many people can one sory take before commit_txn falls over?
+
+    python -m sory.loadtest --clients 16 --seconds 10 \\
+        --mix read=80,board=2,column=8,card=10
+
+By default it makes a throwaway instance folder, starts the app from
+create_app on a local threaded server, seeds a few boards and columns,
+and lets the clients loose on GET /, create_board, create_column and
+create_card in the given proportions. Pass --url to point it at a sory
+you're already running instead (say, under gunicorn), and --set to hand
+the app config, e.g. --set SORY_REPO_PER_BOARD=true.
+
+Errors are counted per message, including the ones sory renders into a
+200 page like "I don't want to mess with that."
+"""
+from typing import Dict, List, Optional, Tuple
+
+import argparse
+from collections import Counter, defaultdict
+import html
+import http.client
+import json
+import logging
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote, urlencode, urlsplit
+
+
+ops = ("read", "board", "column", "card")
+errors_ul = re.compile(r'<ul class="errors">(.*?)</ul>', re.S)
+error_li = re.compile(r"<li>(.*?)</li>", re.S)
+name_chars = "abcdefghijklmnopqrstuvwxyz"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        op, _, weight = part.partition("=")
+        if op not in ops:
+            raise argparse.ArgumentTypeError(f"Unknown op {op}.")
+        weights[op] = float(weight)
+    return weights
+
+
+def parse_setting(setting: str) -> Tuple[str, object]:
+    key, _, value = setting.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    rank = round(p * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, rank))]
+
+
+# -- the app under test
+
+
+class server:
+    """create_app on a fresh instance folder, served from a thread."""
+
+    def __init__(self, config: Dict[str, object], keep: bool) -> None:
+        from werkzeug.serving import make_server
+        from . import create_app
+
+        # a line per request would drown the report
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+        self.keep = keep
+        self.instance_path = tempfile.mkdtemp(prefix="sory-loadtest-")
+        app = create_app(config, instance_path=self.instance_path)
+        self._server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+
+    def __enter__(self) -> "server":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        if self.keep:
+            print(f"Kept {self.instance_path}", file=sys.stderr)
+        else:
+            shutil.rmtree(self.instance_path, ignore_errors=True)
+
+
+# -- clients
+
+
+class client:
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+
+    def request(
+        self, method: str, path: str, form: Optional[Dict[str, str]] = None
+    ) -> Tuple[float, Optional[str]]:
+        """Seconds taken, and what went wrong if anything did."""
+        body = urlencode(form) if form else None
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        start = time.perf_counter()
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request(method, self.prefix + path, body, headers)
+            response = conn.getresponse()
+            page = response.read().decode(errors="replace")
+        except (OSError, http.client.HTTPException) as e:
+            return time.perf_counter() - start, type(e).__name__
+        finally:
+            conn.close()
+        elapsed = time.perf_counter() - start
+
+        if response.status >= 400:
+            return elapsed, f"HTTP {response.status}"
+        ul = errors_ul.search(page)
+        if ul:
+            messages = error_li.findall(ul.group(1))
+            return elapsed, html.unescape(messages[0].strip())
+        return elapsed, None
+
+
+def _name(rng: random.Random, n: int = 8) -> str:
+    return "".join(rng.choice(name_chars) for _ in range(n))
+
+
+class workload:
+    def __init__(self, weights: Dict[str, float], n_boards: int) -> None:
+        self.ops = list(weights)
+        self.weights = [weights[op] for op in self.ops]
+        self.boards = [f"load{c}" for c in name_chars[:n_boards]]
+        self.columns = ["todo", "doing", "done"]
+
+    def seed(self, c: client) -> None:
+        for b in self.boards:
+            c.request("POST", "/boards/create", {"name": b})
+            for col in self.columns:
+                c.request("POST", f"/board/{b}/create", {"name": col})
+
+    def step(
+        self, c: client, rng: random.Random
+    ) -> Tuple[str, float, Optional[str]]:
+        op = rng.choices(self.ops, self.weights)[0]
+        b = rng.choice(self.boards)
+        col = quote(rng.choice(self.columns))
+        if op == "read":
+            result = c.request("GET", f"/?board={b}")
+        elif op == "board":
+            result = c.request("POST", "/boards/create", {"name": _name(rng)})
+        elif op == "column":
+            result = c.request(
+                "POST", f"/board/{b}/create", {"name": _name(rng)}
+            )
+        else:
+            result = c.request(
+                "POST",
+                f"/board/{b}/column/{col}/create",
+                {"name": _name(rng)},
+            )
+        return (op,) + result
+
+
+def drive(
+    url: str,
+    work: workload,
+    n_clients: int,
+    seconds: float,
+    seed: int,
+) -> Tuple[Dict[str, List[float]], Dict[str, Counter], float]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Counter] = defaultdict(Counter)
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def run(i: int) -> None:
+        c = client(url)
+        rng = random.Random(seed + i)
+        mine = []
+        while time.monotonic() < deadline:
+            mine.append(work.step(c, rng))
+        with lock:
+            for op, elapsed, error in mine:
+                latencies[op].append(elapsed)
+                if error:
+                    errors[op][error] += 1
+
+    threads = [
+        threading.Thread(target=run, args=(i,)) for i in range(n_clients)
+    ]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.monotonic() - start
+
+
+# -- reporting
+
+
+def summarize(
+    latencies: Dict[str, List[float]], errors: Dict[str, Counter], wall: float
+) -> Dict[str, Dict]:
+    report = {}
+    everything = []
+    all_errors: Counter = Counter()
+    for op in ops:
+        if op not in latencies:
+            continue
+        values = sorted(latencies[op])
+        everything.extend(values)
+        all_errors.update(errors[op])
+        report[op] = _row(values, errors[op], wall)
+    report["all"] = _row(sorted(everything), all_errors, wall)
+    return report
+
+
+def _row(values: List[float], errors: Counter, wall: float) -> Dict:
+    n = len(values)
+    n_errors = sum(errors.values())
+    return {
+        "requests": n,
+        "per_second": n / wall if wall else 0.0,
+        "p50_ms": 1000 * percentile(values, 0.50),
+        "p95_ms": 1000 * percentile(values, 0.95),
+        "p99_ms": 1000 * percentile(values, 0.99),
+        "error_rate": n_errors / n if n else 0.0,
+        "errors": dict(errors.most_common()),
+    }
+
+
+def print_report(report: Dict[str, Dict]) -> None:
+    print(
+        f"{'op':<8}{'reqs':>8}{'req/s':>10}"
+        f"{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'err%':>8}"
+    )
+    for op, row in report.items():
+        print(
+            f"{op:<8}{row['requests']:>8}{row['per_second']:>10.1f}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+            f"{row['p99_ms']:>10.1f}{100 * row['error_rate']:>8.2f}"
+        )
+    errors = report["all"]["errors"]
+    if errors:
+        print()
+        for message, count in errors.items():
+            print(f"{count:>8}  {message}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m sory.loadtest", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("read=80,board=2,column=8,card=10"),
+        help="Relative weights of read, board, column and card.",
+    )
+    parser.add_argument("--boards", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Load an already running sory.")
+    parser.add_argument(
+        "--set",
+        dest="config",
+        type=parse_setting,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="App config for the throwaway instance. Values are JSON.",
+    )
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    work = workload(args.mix, args.boards)
+
+    def run(url: str) -> Dict[str, Dict]:
+        work.seed(client(url))
+        return summarize(
+            *drive(url, work, args.clients, args.seconds, args.seed)
+        )
+
+    if args.url:
+        report = run(args.url)
+    else:
+        with server(dict(args.config), args.keep) as s:
+            report = run(s.url)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+Repository upkeep.
+
+commit_txn makes a commit per edit, so the repos fill up with loose
+objects and every git call gets a little slower. This watches the object
+counts and repacks or gcs when they get out of hand, optionally squashing
+old fine-grained history first.
+
+Run it by hand with `flask maintain`, or set SORY_MAINT_INTERVAL (seconds)
+to have a background thread do it whenever the instance has been idle
+for SORY_MAINT_IDLE seconds. Only one worker at a time gets to do it.
+The last run's stats go in .sory/maintenance.json.
+"""
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+import json
+import os
+import posixpath
+from os.path import join, exists
+import threading
+import time
+
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+
+from . import history
+from . import model
+from . import sync
+
+if TYPE_CHECKING:
+    import git
+
+
+defaults = {
+    "SORY_MAINT_INTERVAL": None,
+    "SORY_MAINT_IDLE": 30,
+    "SORY_MAINT_LOOSE_OBJECTS": 256,
+    "SORY_MAINT_PACKS": 16,
+    "SORY_MAINT_SQUASH_AFTER_DAYS": None,
+}
+
+
+def _config(key: str) -> Any:
+    return current_app.config.get(key, defaults[key])
+
+
+def _stats_path() -> str:
+    return join(model.sory_dir, "maintenance.json")
+
+
+# -- looking
+
+
+def object_stats(repo: "git.Repo") -> Dict[str, int]:
+    """`git count-objects -v` as a dict. Sizes are in KiB."""
+    stats = {}
+    for line in repo.git.count_objects("-v").splitlines():
+        key, value = line.split(":")
+        stats[key.strip()] = int(value)
+    return stats
+
+
+def last_run() -> Optional[Dict[str, Any]]:
+    if not exists(_stats_path()):
+        return None
+    with open(_stats_path(), "r") as f:
+        return json.load(f)
+
+
+# -- history compaction
+
+
+def _date(seconds: int, tz_offset: int) -> str:
+    from git.objects.util import altz_to_utctz_str
+
+    # raw git date format, so nothing gets lost to timezone parsing
+    return f"{seconds} {altz_to_utctz_str(tz_offset)}"
+
+
+bookkeeping = (model.index_file, model.meta_file)
+
+# where the last pass left off, so the next one doesn't walk it all again
+squash_ref = "refs/sory/squashed"
+
+
+class _Entry(NamedTuple):
+    sha: str
+    committed_date: int
+    paths: FrozenSet[str]
+
+
+def _day_and_paths(e: _Entry) -> Any:
+    day = datetime.fromtimestamp(e.committed_date, timezone.utc).date()
+    # a card edit also touches its column's .index and the board's .meta,
+    # but only when the preview or front matter changed, so leave those
+    # out. Unless that's all there is, like adding a column.
+    cards = frozenset(
+        p for p in e.paths if posixpath.basename(p) not in bookkeeping
+    )
+    return day, cards or e.paths
+
+
+def _settled(repo: "git.Repo", head: str) -> Optional[str]:
+    """The last pass's stopping point, if it's still in `head`'s history."""
+    import git
+
+    try:
+        sha = repo.git.rev_parse("--verify", "-q", squash_ref)
+    except git.GitCommandError:
+        return None
+    return sha if repo.is_ancestor(sha, head) else None
+
+
+def _walk(repo: "git.Repo", since: Optional[str], head: str) -> List[_Entry]:
+    """First-parent history after `since`, oldest first, in one git call."""
+    out = repo.git.log(
+        "--first-parent",
+        "--reverse",
+        "--no-renames",
+        "--format=%x00%H %ct",
+        "--name-only",
+        f"{since}..{head}" if since else head,
+    )
+    entries = []
+    for commit in out.split("\0")[1:]:
+        header, *paths = commit.split("\n")
+        sha, committed_date = header.split(" ")
+        entries.append(
+            _Entry(sha, int(committed_date), frozenset(p for p in paths if p))
+        )
+    return entries
+
+
+def _recommit(
+    repo: "git.Repo",
+    run: List["git.Commit"],
+    parent: Optional["git.Commit"],
+) -> "git.Commit":
+    import git
+
+    last = run[-1]
+    if len(run) == 1:
+        message = last.message
+    else:
+        message = f"Squash {len(run)} edits.\n\n" + "".join(
+            f"{c.hexsha[:8]} {c.summary}\n" for c in run
+        )
+    return git.Commit.create_from_tree(
+        repo,
+        last.tree,
+        message,
+        parent_commits=[parent] if parent else [],
+        author=last.author,
+        committer=last.committer,
+        author_date=_date(last.authored_date, last.author_tz_offset),
+        commit_date=_date(last.committed_date, last.committer_tz_offset),
+    )
+
+
+def squash_history(repo: "git.Repo", before: datetime) -> int:
+    """
+    Collapse runs of consecutive commits older than `before` that touch
+    the same cards on the same (UTC) day into one commit per run. In
+    practice that's a commit per card per day. Newer commits are replayed
+    on top with their trees untouched, so the working tree and index
+    stay as they are. The old head is tagged first so nothing is lost.
+
+    Only history since the last pass is looked at: everything before
+    its last old run is already as squashed as it will get.
+
+    Call it holding the repo's writer lock. Returns how many commits
+    went away.
+    """
+    if not repo.head.is_valid():
+        return 0
+    head = repo.head.commit
+    settled = _settled(repo, head.hexsha)
+    walked = _walk(repo, settled, head.hexsha)
+    cutoff = before.timestamp()
+    old = [e for e in walked if e.committed_date < cutoff]
+    new = walked[len(old) :]
+
+    runs = [list(run) for _, run in groupby(old, key=_day_and_paths)]
+    if len(runs) == len(old):
+        if len(runs) > 1:
+            repo.git.update_ref(squash_ref, runs[-2][-1].sha)
+        return 0
+
+    # lightweight, so it doesn't need a committer identity configured
+    repo.create_tag(f"audit/{head.committed_date}-{head.hexsha[:8]}", head)
+
+    # runs before the first squashable one stay exactly as they are
+    first = next(i for i, run in enumerate(runs) if len(run) > 1)
+    if first:
+        parent = repo.commit(runs[first - 1][-1].sha)
+    else:
+        parent = repo.commit(settled) if settled else None
+    settle_at = parent if first == len(runs) - 1 else None
+    for i, run in enumerate(runs[first:], first):
+        parent = _recommit(repo, [repo.commit(e.sha) for e in run], parent)
+        if i == len(runs) - 2:
+            settle_at = parent
+    for e in new:
+        parent = _recommit(repo, [repo.commit(e.sha)], parent)
+
+    repo.head.reference.set_commit(parent)
+    if settle_at is not None:
+        repo.git.update_ref(squash_ref, settle_at.hexsha)
+    return len(old) - len(runs)
+
+
+# -- doing
+
+
+def maintain_repo(repo: "git.Repo", squash_before: Optional[datetime]) -> Dict:
+    start = time.perf_counter()
+    before = object_stats(repo)
+    actions = []
+
+    squashed = 0
+    if squash_before is not None:
+        squashed = squash_history(repo, squash_before)
+        if squashed:
+            actions.append(f"squashed {squashed} commits")
+
+    if before["count"] >= _config("SORY_MAINT_LOOSE_OBJECTS"):
+        # incremental: packs up the loose objects, leaves old packs be
+        repo.git.repack("-d", "-q")
+        actions.append("repack")
+
+    if squashed or before["packs"] >= _config("SORY_MAINT_PACKS"):
+        repo.git.gc("-q")
+        actions.append("gc")
+
+    return {
+        "repo": repo.working_tree_dir,
+        "before": before,
+        "after": object_stats(repo),
+        "actions": actions,
+        "squashed": squashed,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def maintain(squash_after_days: Optional[float] = None) -> Optional[Dict]:
+    """
+    One pass over every repo in the instance. Returns None if another
+    worker is busy doing it already.
+    """
+    if squash_after_days is None:
+        squash_after_days = _config("SORY_MAINT_SQUASH_AFTER_DAYS")
+    squash_before = None
+    if squash_after_days is not None:
+        squash_before = datetime.now(timezone.utc) - timedelta(
+            days=squash_after_days
+        )
+
+    runner = sync.FileLock(join(model.sory_dir, "maint.lock"))
+    with runner.attempt() as got_it:
+        if not got_it:
+            return None
+
+        start = time.time()
+        repos = []
+        for root in model.repo_roots():
+            # writers wait; we only get here when things are quiet anyway
+            with model.lock_for(root).exclusive():
+                repo = model.repo_for(root)
+                repos.append(maintain_repo(repo, squash_before))
+                if repos[-1]["squashed"]:
+                    # the shas in the card history index are stale now
+                    history.rebuild(repo, model.history_log(root))
+
+        stats = {
+            "started": start,
+            "seconds": time.time() - start,
+            "generation": model.generation.value,
+            "repos": repos,
+        }
+        tmp = f"{_stats_path()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(stats, f, indent=2)
+        os.replace(tmp, _stats_path())
+        return stats
+
+
+# -- scheduling
+
+
+class scheduler(threading.Thread):
+    """
+    Wakes up every `interval` seconds. Runs maintenance once the write
+    generation has sat still for `idle` seconds, and not again until
+    something has been written since.
+    """
+
+    def __init__(self, app: Flask) -> None:
+        super().__init__(name="sory-maint", daemon=True)
+        self.app = app
+        self.interval = app.config["SORY_MAINT_INTERVAL"]
+        self.idle = app.config.get(
+            "SORY_MAINT_IDLE", defaults["SORY_MAINT_IDLE"]
+        )
+
+    def run(self) -> None:
+        with self.app.app_context():
+            seen = model.generation.value
+            seen_at = time.monotonic()
+            done = None
+            while True:
+                time.sleep(self.interval)
+                now = model.generation.value
+                if now != seen:
+                    seen, seen_at = now, time.monotonic()
+                elif now != done and time.monotonic() - seen_at >= self.idle:
+                    try:
+                        maintain()
+                    except Exception:
+                        self.app.logger.exception("Maintenance failed.")
+                    done = model.generation.value
+
+
+@click.command("maintain")
+@click.option(
+    "--squash-after-days",
+    type=float,
+    default=None,
+    help="Squash same-day edit commits older than this.",
+)
+@click.option("--stats", is_flag=True, help="Just show the last run.")
+@with_appcontext
+def maintain_command(squash_after_days: Optional[float], stats: bool) -> None:
+    """Repack, gc and optionally compact the board repos."""
+    if not stats:
+        if maintain(squash_after_days) is None:
+            click.echo("Somebody else is already on it.")
+            return
+    click.echo(json.dumps(last_run(), indent=2))
+
+
+def init_app(app: Flask) -> None:
+    app.cli.add_command(maintain_command)
+
+    if not app.config.get("SORY_MAINT_INTERVAL"):
+        return
+
+    # start on the first request rather than here, so the thread ends up
+    # in the worker and not in a parent that is about to fork
+    starting = threading.Lock()
+    started = []
+
+    @app.before_request
+    def start_maintenance() -> None:
+        if started:
+            return
+        with starting:
+            if not started:
+                started.append(scheduler(app))
+                started[0].start()
@@ -0,0 +1,246 @@
+"""
+In-process counters and histograms, served at /metrics in the Prometheus
+text format.
+
+Observing is a bisect and a dict update under a lock, so it's cheap
+enough to leave on. Numbers are per process: with several gunicorn
+workers, each scrape sees whichever worker answered, so scrape them
+individually or treat the series as samples.
+"""
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import threading
+from time import perf_counter
+
+import flask
+from flask import Blueprint, Flask, Response, g, has_request_context, request
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+registry: List["metric"] = []
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(
+            k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in labels
+    )
+    return f"{{{inner}}}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# -- metric types
+
+
+class metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n"
+        head += f"# TYPE {self.name} {self.kind}\n"
+        return head + "".join(f"{line}\n" for line in self.samples())
+
+
+class counter(metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, n: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_fmt_labels(labels)} {_fmt_value(value)}"
+
+
+class histogram(metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float]) -> None:
+        super().__init__(name, help)
+        self.buckets = sorted(buckets) + [float("inf")]
+        # labels -> (count per bucket, not cumulative yet; sum)
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = ([0] * len(self.buckets), [0.0])
+            counts, total = self._values[key]
+            counts[i] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [
+                (labels, list(counts), total[0])
+                for labels, (counts, total) in sorted(self._values.items())
+            ]
+        for labels, counts, total in values:
+            running = 0
+            for le, n in zip(self.buckets, counts):
+                running += n
+                le_label = (("le", _fmt_value(le)),)
+                yield (
+                    f"{self.name}_bucket{_fmt_labels(labels, le_label)} "
+                    f"{running}"
+                )
+            yield f"{self.name}_sum{_fmt_labels(labels)} {_fmt_value(total)}"
+            yield f"{self.name}_count{_fmt_labels(labels)} {running}"
+
+
+def expose() -> str:
+    return "".join(m.expose() for m in registry)
+
+
+def timed_generator(
+    seconds: histogram, count: histogram, **labels: str
+) -> Callable:
+    """
+    Time only what's spent inside the generator (not in its consumer),
+    and count what it yields. Observed when it finishes or is dropped.
+    """
+
+    def decorate(gen_fn: Callable) -> Callable:
+        @wraps(gen_fn)
+        def wrapper(*args, **kwargs):
+            it = gen_fn(*args, **kwargs)
+            spent = 0.0
+            n = 0
+            try:
+                while True:
+                    start = perf_counter()
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        return
+                    finally:
+                        spent += perf_counter() - start
+                    n += 1
+                    yield item
+            finally:
+                it.close()
+                seconds.observe(spent, **labels)
+                count.observe(n, **labels)
+
+        return wrapper
+
+    return decorate
+
+
+# -- what we measure
+
+
+fast = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+slow = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+commit_seconds = histogram(
+    "sory_commit_seconds",
+    "commit_txn time by stage: lock_wait, index_diff, add, verify, "
+    "commit and total.",
+    slow,
+)
+list_seconds = histogram(
+    "sory_list_seconds",
+    "Filesystem enumeration of a board's columns or a column's cards.",
+    fast,
+)
+convert_seconds = histogram(
+    "sory_convert_seconds", "Time spent in lex or parse per card.", fast
+)
+convert_tokens = histogram(
+    "sory_convert_tokens",
+    "Tokens out of lex or blocks out of parse per card.",
+    (1, 10, 100, 1000, 10000, 100000),
+)
+render_seconds = histogram(
+    "sory_render_seconds", "Template rendering time per view.", fast
+)
+request_seconds = histogram(
+    "sory_request_seconds", "Whole request time per view.", slow
+)
+cache_total = counter(
+    "sory_cache_total", "In-process cache lookups by cache and result."
+)
+
+
+# -- flask glue
+
+
+def _view() -> str:
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    return "none"
+
+
+bp = Blueprint("metrics", __name__)
+
+
+@bp.route("/metrics", methods=("GET",))
+def metrics():
+    return Response(expose(), mimetype="text/plain; version=0.0.4")
+
+
+# not template signals, which need blinker
+def render_template(template_name: str, **context) -> str:
+    """flask.render_template, timed into sory_render_seconds."""
+    with render_seconds.time(view=_view()):
+        return flask.render_template(template_name, **context)
+
+
+def init_app(app: Flask) -> None:
+    app.register_blueprint(bp)
+
+    @app.before_request
+    def start_timer() -> None:
+        g.sory_request_started = perf_counter()
+
+    @app.teardown_request
+    def stop_timer(exc) -> None:
+        started = g.pop("sory_request_started", None)
+        if started is not None:
+            request_seconds.observe(perf_counter() - started, view=_view())
@@ -3,17 +3,36 @@ The add_* return instance whether or not it exists, and should persist
 it either way.
 The get_* and *.from_path return only existing instances.
 """
-from typing import Any, Generator, List
-
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from collections import defaultdict
 from contextlib import contextmanager
 from glob import glob
+import json
 import os
 from os.path import join, isfile, isdir, exists
 import string
-from threading import Lock
+from time import perf_counter
+
+from flask import Flask, current_app
+
+from . import history
+from . import sync
+from .metrics import cache_total, commit_seconds, list_seconds
 
-from flask import current_app
-import git
+if TYPE_CHECKING:
+    import git
 
 
 # -- oh these guys? haha. they're cool. they're with me.
@@ -22,21 +41,28 @@ import git
 ext = ".md"
 glob_ext = f"*{ext}"
 ext_len = len(ext)
+meta_file = ".meta"
+index_file = ".index"
 
 
 # -- path library
 
 
+# dot directories (.git, .sory) are bookkeeping, not boards or columns
 def list_subdir_paths_no_trailing_slash(the_dir: str) -> List[str]:
     return [
         join(the_dir, d).rstrip("/")
         for d in os.listdir(the_dir)
-        if isdir(join(the_dir, d))
+        if not d.startswith(".") and isdir(join(the_dir, d))
     ]
 
 
 def list_subdir_names(the_dir: str) -> List[str]:
-    return [d for d in os.listdir(the_dir) if isdir(join(the_dir, d))]
+    return [
+        d
+        for d in os.listdir(the_dir)
+        if not d.startswith(".") and isdir(join(the_dir, d))
+    ]
 
 
 # -- errors
@@ -60,34 +86,223 @@ def ass(condition: Any, message: str, no=False) -> None:
     raise ImSory(message)
 
 
-# -- git layer
+# -- instance state
+# Nothing here touches the disk, git or even current_app until the
+# first time it's needed, so importing the model is free and works
+# outside an app context. `preload` does it all up front instead.
 
 
-lock = Lock()
+class instance:
+    """What the model keeps per instance folder."""
 
-try:
-    repo = git.Repo(current_app.instance_path)
-except git.InvalidGitRepositoryError:
-    repo = git.Repo.init(current_app.instance_path)
+    def __init__(self, app: Flask) -> None:
+        self.path = app.instance_path
 
+        # Runtime bookkeeping that is never committed lives in here.
+        self.sory_dir = join(self.path, ".sory")
+
+        # With SORY_REPO_PER_BOARD, every board directory is its own git
+        # repo and gets its own writer lock, so boards don't contend with
+        # each other. Otherwise the whole instance folder is one repo.
+        # Pick one per instance.
+        self.sharded = bool(app.config.get("SORY_REPO_PER_BOARD", False))
+
+        # Only kept in sharded mode, where the instance folder has no repo
+        # of its own. One board name per line.
+        self.registry_path = join(self.sory_dir, "boards")
+
+        self.repos: Dict[str, "git.Repo"] = {}
+        self.locks: Dict[str, sync.FileLock] = {}
+
+        # cache -> path -> (generation when loaded, value)
+        self.caches: Dict[str, Dict[str, Tuple[int, Any]]] = defaultdict(dict)
+
+        self._lock: Optional[sync.FileLock] = None
+        self._generation: Optional[sync.Generation] = None
+
+    @property
+    def lock(self) -> sync.FileLock:
+        # The writer lock is an flock, so it holds across gunicorn workers
+        # as well as threads. Readers take it shared. In sharded mode this
+        # one only guards the board registry.
+        if self._lock is None:
+            self._lock = sync.FileLock(join(self.sory_dir, "write.lock"))
+        return self._lock
+
+    @property
+    def generation(self) -> sync.Generation:
+        # Bumped by every commit. Compare against a remembered value to
+        # find out whether some worker has written since, without git.
+        if self._generation is None:
+            self._generation = sync.Generation(
+                join(self.sory_dir, "generation")
+            )
+        return self._generation
+
+
+def _instance() -> instance:
+    state = current_app.extensions.get("sory_model")
+    if state is None:
+        state = current_app.extensions.setdefault(
+            "sory_model", instance(current_app)
+        )
+    return state
+
+
+# -- git layer
+
+
+def _open_repo(root: str) -> "git.Repo":
+    # GitPython is most of our import time, so it waits until here
+    import git
 
-@contextmanager
-def commit_txn(path: str, commit_message: str) -> Generator[None, None, None]:
-    ass(not repo.index.diff(None), "I don't want to mess with that.")
-    lock.acquire()
     try:
-        yield
-    except ImSory:
-        raise
+        return git.Repo(root)
+    except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+        return git.Repo.init(root)
+
+
+def repo_root(path: str) -> str:
+    """Root of the repo which tracks `path`."""
+    state = _instance()
+    if not state.sharded:
+        return state.path
+    rel = os.path.relpath(path, state.path)
+    board_name = rel.split(os.sep)[0]
+    ass(
+        board_name not in (os.curdir, os.pardir),
+        f"{path} is not inside a board.",
+    )
+    return join(state.path, board_name)
+
+
+def repo_for(path: str) -> "git.Repo":
+    repos = _instance().repos
+    root = repo_root(path)
+    if root not in repos:
+        cache_total.inc(cache="repo", result="miss")
+        repos[root] = _open_repo(root)
     else:
-        repo.index.add([path])
-        ass(
-            len(repo.index.diff(None)) == 1,
-            "Whoah there. One thing at a time.",
+        cache_total.inc(cache="repo", result="hit")
+    return repos[root]
+
+
+def lock_for(path: str) -> sync.FileLock:
+    state = _instance()
+    if not state.sharded:
+        return state.lock
+    root = repo_root(path)
+    if root not in state.locks:
+        name = os.path.basename(root)
+        state.locks[root] = sync.FileLock(
+            join(state.sory_dir, "locks", f"{name}.lock")
         )
-        repo.index.commit(commit_message)
-    finally:
-        lock.release()
+    return state.locks[root]
+
+
+def repo_roots() -> List[str]:
+    state = _instance()
+    if not state.sharded:
+        return [state.path]
+    return [join(state.path, n) for n in _registered_names()]
+
+
+def history_log(path: str) -> str:
+    """Where the path -> commits index for `path`'s repo lives."""
+    state = _instance()
+    root = repo_root(path)
+    name = os.path.basename(root) if state.sharded else "instance"
+    return join(state.sory_dir, "history", f"{name}.log")
+
+
+class _Nevermind(Exception):
+    """
+    Raise inside commit_txn, before writing anything, to leave without a
+    commit. For when another worker already did it while we waited.
+    """
+
+
+@contextmanager
+def commit_txn(
+    path: str, commit_message: str, also: Iterable[str] = ()
+) -> Generator[None, None, None]:
+    started = perf_counter()
+    with lock_for(path).exclusive():
+        commit_seconds.observe(perf_counter() - started, stage="lock_wait")
+        the_repo = repo_for(path)
+        # check under the lock, or we'd see another worker mid-commit
+        with commit_seconds.time(stage="index_diff"):
+            ass(
+                not the_repo.index.diff(None),
+                "I don't want to mess with that.",
+            )
+        try:
+            yield
+        except _Nevermind:
+            return
+        with commit_seconds.time(stage="add"):
+            # not index.add, which chdirs the whole process into the repo
+            # and races commits to other boards' repos
+            the_repo.git.add("--", path, *[p for p in also if exists(p)])
+        with commit_seconds.time(stage="verify"):
+            ass(
+                not the_repo.index.diff(None),
+                "Whoah there. One thing at a time.",
+            )
+            staged = the_repo.git.diff("--cached", "--name-only")
+        if not staged:
+            # saved just as it was. an empty commit would only bump the
+            # generation, and leave the history log a sha behind.
+            return
+        with commit_seconds.time(stage="commit"):
+            commit = the_repo.index.commit(commit_message)
+            history.record(the_repo, history_log(path), commit)
+        _instance().generation.bump()
+    commit_seconds.observe(perf_counter() - started, stage="total")
+
+
+# -- in-process caches
+# Good until the write generation moves, so a worker notices what the
+# others wrote without asking git.
+
+
+def _cached(cache: str, path: str, load: Callable[[], Any]) -> Any:
+    state = _instance()
+    seen = state.generation.value
+    hit = state.caches[cache].get(path)
+    if hit and hit[0] == seen:
+        cache_total.inc(cache=cache, result="hit")
+        return hit[1]
+    cache_total.inc(cache=cache, result="miss")
+    value = load()
+    state.caches[cache][path] = (seen, value)
+    return value
+
+
+# -- board registry
+
+
+def _registered_names() -> List[str]:
+    state = _instance()
+    if not exists(state.registry_path):
+        with state.lock.exclusive():
+            if not exists(state.registry_path):
+                # backfill once from whatever is on disk
+                names = list_subdir_names(state.path)
+                with open(state.registry_path, "w") as registry:
+                    registry.writelines(f"{n}\n" for n in sorted(names))
+    with state.lock.shared():
+        with open(state.registry_path, "r") as registry:
+            return [line.rstrip("\n") for line in registry if line.strip()]
+
+
+def _register(name: str) -> None:
+    state = _instance()
+    _registered_names()  # make sure it's there
+    with state.lock.exclusive():
+        with open(state.registry_path, "r+") as registry:
+            if f"{name}\n" not in registry.readlines():
+                registry.write(f"{name}\n")
 
 
 # -- model classes
@@ -136,7 +351,7 @@ class card:
     @property
     def content(self) -> str:
         self._validate()
-        with lock:
+        with lock_for(self.path).shared():
             with open(self.path, "r") as card_md:
                 content = card_md.read()
         return content
@@ -144,9 +359,50 @@ class card:
     @content.setter
     def content(self, value: str) -> None:
         ass(isinstance(value, str), "Um, string please?")
-        with commit_txn(self.path, f"Update card {self.name}."):
+        from . import convert
+
+        try:
+            front = convert.front_matter(value)
+        except AssertionError:
+            ass(False, "Front matter should be key: value lines.")
+        the_column = column.from_path(self.column_root)
+        the_board = board.from_path(the_column.board_root)
+        with commit_txn(
+            self.path,
+            f"Update card {self.name}.",
+            also=[the_board.meta_path, the_column.index_path],
+        ):
             with open(self.path, "w") as card_md:
                 card_md.write(value)
+            the_board._update_meta(self.key, front)
+            the_column._update_preview(self.name, value)
+
+    @property
+    def key(self) -> str:
+        """What the board's indexes call this card."""
+        return f"{os.path.basename(self.column_root)}/{self.name}"
+
+    def _history_log(self) -> str:
+        log = history_log(self.path)
+        if not exists(log):
+            # backfill once, from whatever history there already is
+            with lock_for(self.path).exclusive():
+                if not exists(log):
+                    history.rebuild(repo_for(self.path), log)
+        return log
+
+    def history(self, start: int, n: int) -> List[history.Revision]:
+        return history.revisions(
+            repo_for(self.path), self._history_log(), self.repo_path, start, n
+        )
+
+    @property
+    def n_revisions(self) -> int:
+        return history.count(self._history_log(), self.repo_path)
+
+    @property
+    def repo_path(self) -> str:
+        return os.path.relpath(self.path, repo_root(self.path))
 
     @staticmethod
     def from_filename(filename: str) -> "card":
@@ -166,6 +422,7 @@ class column:
         self.name = name
         self.board_root = board_root
         self.path = join(board_root, name)
+        self.index_path = join(self.path, index_file)
         self._validate()
 
     def _validate(self) -> None:
@@ -189,10 +446,10 @@ class column:
             os.makedirs(self.path)
 
         # Ensure index exists
-        if exists(join(self.path, ".index")):
-            ass(isfile(join(self.path, ".index")), "Bad column index.")
+        if exists(self.index_path):
+            ass(isfile(self.index_path), "Bad column index.")
         else:
-            open(join(self.path, ".index"), "w").close()
+            open(self.index_path, "w").close()
 
     def __contains__(self, other: Any) -> bool:
         return isinstance(other, card) and card in self.cards
@@ -200,11 +457,75 @@ class column:
     @property
     def cards(self) -> List[card]:
         self._validate()
-        return [card.from_filename(f) for f in glob(join(self.path, glob_ext))]
+        with list_seconds.time(what="cards"):
+            filenames = glob(join(self.path, glob_ext))
+        return [card.from_filename(f) for f in filenames]
 
     def get_card(self, name: str) -> card:
         return card.from_filename(join(self.path, f"{name}{ext}"))
 
+    # -- previews
+    # The column's .index keeps card name -> convert.Preview fields, so
+    # showing previews costs a read per column rather than per card.
+    # It's refreshed when a card's content is set, and backfilled in its
+    # own commit for any card written before there were previews.
+
+    def _read_previews(self) -> Dict[str, Dict[str, Any]]:
+        # callers hold a lock
+        with open(self.index_path, "r") as f:
+            raw = f.read()
+        return json.loads(raw) if raw.strip() else {}
+
+    def _write_previews(self, previews: Dict[str, Dict[str, Any]]) -> None:
+        with open(self.index_path, "w") as f:
+            json.dump(previews, f, separators=(",", ":"), sort_keys=True)
+
+    def _preview(self, text: str) -> Dict[str, Any]:
+        from . import convert
+
+        n_chars = current_app.config.get("SORY_PREVIEW_CHARS", 140)
+        return convert.preview(text, n_chars)._asdict()
+
+    def _update_preview(self, name: str, text: str) -> None:
+        # inside commit_txn
+        previews = self._read_previews()
+        previews[name] = self._preview(text)
+        self._write_previews(previews)
+
+    def _missing_previews(
+        self, previews: Dict[str, Dict[str, Any]]
+    ) -> List[card]:
+        # cards written before there were previews, empty ones don't need any
+        return [
+            k
+            for k in self.cards
+            if k.name not in previews and os.path.getsize(k.path)
+        ]
+
+    def _backfill_previews(self) -> None:
+        with commit_txn(self.index_path, f"Column {self.name} previews."):
+            previews = self._read_previews()
+            missing = self._missing_previews(previews)
+            if not missing:
+                raise _Nevermind  # another worker beat us to it
+            for k in missing:
+                with open(k.path, "r") as card_md:
+                    previews[k.name] = self._preview(card_md.read())
+            self._write_previews(previews)
+
+    def _load_previews(self) -> Dict[str, Dict[str, Any]]:
+        with lock_for(self.path).shared():
+            previews = self._read_previews()
+        if self._missing_previews(previews):
+            self._backfill_previews()
+            with lock_for(self.path).shared():
+                previews = self._read_previews()
+        return previews
+
+    @property
+    def previews(self) -> Dict[str, Dict[str, Any]]:
+        return _cached("previews", self.path, self._load_previews)
+
     def add_card(self, name: str) -> card:
         try:
             return self.get_card(name)
@@ -262,14 +583,95 @@ class board:
 
     @property
     def columns(self) -> List[column]:
-        return [
-            column.from_path(p)
-            for p in list_subdir_paths_no_trailing_slash(self.path)
-        ]
+        with list_seconds.time(what="columns"):
+            paths = list_subdir_paths_no_trailing_slash(self.path)
+        return [column.from_path(p) for p in paths]
 
     def get_column(self, name: str) -> column:
         return column.from_path(join(self.path, name))
 
+    # -- front matter index
+    # card key -> that card's front matter, for every card that has any.
+    # Kept in the board's .meta and committed along with card edits, so
+    # filtering a board never has to open its cards.
+
+    @property
+    def meta_path(self) -> str:
+        return join(self.path, meta_file)
+
+    def _read_meta(self) -> Dict[str, Dict[str, str]]:
+        # callers hold a lock
+        if not exists(self.meta_path):
+            return self._backfill_meta()
+        with open(self.meta_path, "r") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: Dict[str, Dict[str, str]]) -> None:
+        with open(self.meta_path, "w") as f:
+            json.dump(meta, f, separators=(",", ":"), sort_keys=True)
+
+    def _backfill_meta(self) -> Dict[str, Dict[str, str]]:
+        from . import convert
+
+        meta = {}
+        for c in self.columns:
+            for k in c.cards:
+                with open(k.path, "r") as card_md:
+                    try:
+                        front = convert.front_matter(card_md.read())
+                    except AssertionError:
+                        continue  # written before we checked, skip it
+                if front:
+                    meta[k.key] = front
+        self._write_meta(meta)
+        return meta
+
+    def _update_meta(self, key: str, front: Dict[str, str]) -> None:
+        # inside commit_txn
+        meta = self._read_meta()
+        if meta.get(key, {}) == front:
+            return
+        if front:
+            meta[key] = front
+        else:
+            del meta[key]
+        self._write_meta(meta)
+
+    def _load_meta(self) -> Dict[str, Dict[str, str]]:
+        if not exists(self.meta_path):
+            # from before there was an index, so it gets its own commit
+            # rather than riding along with whatever comes next
+            with commit_txn(
+                self.meta_path, f"Board {self.name} front matter index."
+            ):
+                if exists(self.meta_path):
+                    raise _Nevermind  # another worker beat us to it
+                self._backfill_meta()
+        with lock_for(self.path).shared():
+            return self._read_meta()
+
+    @property
+    def meta(self) -> Dict[str, Dict[str, str]]:
+        return _cached("meta", self.path, self._load_meta)
+
+    def query(self, filters: Dict[str, List[str]]) -> Set[str]:
+        """
+        Keys of the cards whose front matter matches. Every field has to
+        match one of its values, case insensitively.
+        """
+        wanted = {
+            field: {v.casefold() for v in values}
+            for field, values in filters.items()
+        }
+        return {
+            key
+            for key, front in self.meta.items()
+            if all(
+                front.get(field, "").casefold() in values
+                for field, values in wanted.items()
+            )
+        }
+
     def add_column(self, name: str) -> column:
         try:
             return self.get_column(name)
@@ -293,8 +695,16 @@ def add_board(name: str) -> board:
     try:
         return get_board(name)
     except ImSoryButNo:
-        with commit_txn(current_app.instance_path, f"Add board {name}."):
+        # before commit_txn, which would init a repo for a sharded board
+        ass(all(c in board.chars for c in name), f"Bad board name {name}")
+        path = join(current_app.instance_path, name)
+        with commit_txn(path, f"Add board {name}."):
             b = board(name, current_app.instance_path)
+            b._write_meta({})
+            if _instance().sharded:
+                # before the generation moves, or a page rendered in
+                # between gets cached without the new board in it
+                _register(name)
         return b
 
 
@@ -303,14 +713,45 @@ def get_board(name: str) -> board:
 
 
 def _boards() -> List[board]:
+    if _instance().sharded:
+        return [
+            board.from_path(join(current_app.instance_path, name))
+            for name in _registered_names()
+        ]
     return [
         board.from_path(p)
         for p in list_subdir_paths_no_trailing_slash(current_app.instance_path)
     ]
 
 
+def preload() -> None:
+    """
+    Everything the first request would otherwise pay for: the repos, the
+    lock and generation files, convert, and every board's indexes.
+    Needs an app context.
+    """
+    from . import convert  # noqa: F401
+
+    _instance().generation.value
+    for root in repo_roots():
+        repo_for(root)
+        lock_for(root)
+    for b in _boards():
+        b.meta
+        for c in b.columns:
+            c.previews
+
+
+# the instance state the rest of sory reads off the module
+shared_state = ("sory_dir", "sharded", "registry_path", "lock", "generation")
+
+
 # make this module look like its classes
 def __getattr__(name):
     if name == "boards":
         return _boards()
+    if name in shared_state:
+        return getattr(_instance(), name)
+    if name == "repo" and not _instance().sharded:
+        return repo_for(current_app.instance_path)
     ass(False, f"Um. You were looking for {name}? I don't know her.")
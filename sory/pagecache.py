@@ -0,0 +1,138 @@
+"""
+Rendered pages, compressed once per version and kept around.
+
+Entries are keyed by (board, write generation, query), and hold the
+page in every encoding we can make: identity, gzip, and brotli if the
+`brotli` package is installed. A repeat view is then a dict lookup plus
+a write to the socket. The generation stands in for the HEAD sha: every
+commit in every board and worker bumps it, adding boards included
+(which the nav shows but a sharded board's HEAD wouldn't), and reading
+it doesn't touch git. When it moves, the whole cache goes, since
+nothing in it can be served again.
+
+SORY_PAGE_CACHE_BYTES bounds the total compressed + uncompressed size,
+least recently used out first. Zero turns it off.
+"""
+from typing import Dict, Hashable, Optional, Tuple, Union
+
+from collections import OrderedDict
+import gzip
+import threading
+
+from flask import Flask, Response, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .metrics import cache_total
+
+
+Encodings = Dict[str, bytes]
+
+default_max_bytes = 32 * 1024 * 1024
+
+
+def encode(body: bytes) -> Encodings:
+    # levels are cranked all the way up since we pay once per version
+    encodings = {
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=9),
+    }
+    if brotli is not None:
+        encodings["br"] = brotli.compress(
+            body, mode=brotli.MODE_TEXT, quality=11
+        )
+    return encodings
+
+
+class page_cache:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self._pages: "OrderedDict[Hashable, Tuple[Encodings, int]]" = (
+            OrderedDict()
+        )
+
+    def _sync(self, generation: int) -> bool:
+        """With the lock held. False if `generation` is already stale."""
+        if self.generation is None or generation > self.generation:
+            self._pages.clear()
+            self.n_bytes = 0
+            self.generation = generation
+        return generation == self.generation
+
+    def get(self, generation: int, key: Hashable) -> Optional[Encodings]:
+        with self._lock:
+            if not self._sync(generation):
+                return None
+            hit = self._pages.get(key)
+            if hit is None:
+                return None
+            self._pages.move_to_end(key)
+            return hit[0]
+
+    def put(self, generation: int, key: Hashable, body: bytes) -> Encodings:
+        encodings = encode(body)
+        size = sum(len(b) for b in encodings.values())
+        with self._lock:
+            if not self._sync(generation) or size > self.max_bytes:
+                return encodings
+            if key in self._pages:
+                self.n_bytes -= self._pages.pop(key)[1]
+            self._pages[key] = (encodings, size)
+            self.n_bytes += size
+            while self.n_bytes > self.max_bytes:
+                _, (_, evicted) = self._pages.popitem(last=False)
+                self.n_bytes -= evicted
+        return encodings
+
+
+def respond(encodings: Encodings) -> Response:
+    """Whichever encoding the client likes best."""
+    encoding = request.accept_encodings.best_match(
+        [e for e in ("br", "gzip") if e in encodings] + ["identity"],
+        default="identity",
+    )
+    response = Response(encodings[encoding], mimetype="text/html")
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _cache() -> Optional[page_cache]:
+    return current_app.extensions.get("sory_pages")
+
+
+def get(generation: int, key: Hashable) -> Optional[Response]:
+    cache = _cache()
+    if cache is None:
+        return None
+    encodings = cache.get(generation, key)
+    if encodings is None:
+        cache_total.inc(cache="page", result="miss")
+        return None
+    cache_total.inc(cache="page", result="hit")
+    return respond(encodings)
+
+
+def put(generation: int, key: Hashable, html: str) -> Union[str, Response]:
+    """
+    Cache a page rendered at `generation`, which the caller read before
+    rendering: if a write lands mid-render, this entry dies with the
+    old generation instead of outliving it.
+    """
+    cache = _cache()
+    if cache is None:
+        return html
+    return respond(cache.put(generation, key, html.encode()))
+
+
+def init_app(app: Flask) -> None:
+    max_bytes = app.config.get("SORY_PAGE_CACHE_BYTES", default_max_bytes)
+    if max_bytes:
+        app.extensions["sory_pages"] = page_cache(max_bytes)
@@ -0,0 +1,269 @@
+"""
+Opt-in request profiling, for the slow requests nobody can reproduce.
+
+Two ways in, both off by default:
+
+SORY_PROFILE_SAMPLE
+    Fraction of requests to run under cProfile. Each one is dumped as
+    a .prof you can open with pstats or snakeviz.
+
+SORY_PROFILE_SLOW_MS
+    A stack sampler thread looks at every in-flight request every
+    SORY_PROFILE_INTERVAL_MS and keeps collapsed stacks. Requests that
+    end up over the threshold are dumped as flamegraph-ready text;
+    everything else is thrown away. The request itself pays nothing.
+
+Dumps go in .sory/profiles, only the latest SORY_PROFILE_KEEP of them.
+/admin/profiles lists them with the slowest paths through sory.model
+and sory.convert, and links to each for download.
+"""
+from typing import Counter as CounterT, Dict, List, Optional
+
+from collections import Counter
+import cProfile
+import json
+import os
+from os.path import join, exists
+import pstats
+import random
+import sys
+import threading
+import time
+
+from flask import (
+    Blueprint,
+    Flask,
+    abort,
+    current_app,
+    g,
+    request,
+    send_from_directory,
+)
+
+from .metrics import render_template
+
+
+defaults = {
+    "SORY_PROFILE_SAMPLE": 0.0,
+    "SORY_PROFILE_SLOW_MS": None,
+    "SORY_PROFILE_INTERVAL_MS": 5,
+    "SORY_PROFILE_KEEP": 50,
+}
+
+# the modules whose paths we summarize
+watched = ("sory.model", "sory.convert")
+_here = os.path.dirname(os.path.abspath(__file__))
+watched_files = {
+    join(_here, f"{name.split('.')[-1]}.py"): name for name in watched
+}
+
+bp = Blueprint("profiler", __name__, url_prefix="/admin/profiles")
+
+
+def _config(key: str):
+    return current_app.config.get(key, defaults[key])
+
+
+def profile_dir() -> str:
+    return join(current_app.instance_path, ".sory", "profiles")
+
+
+# -- stack sampler
+
+
+class sampler(threading.Thread):
+    def __init__(self, interval: float) -> None:
+        super().__init__(name="sory-profiler", daemon=True)
+        self.interval = interval
+        self._lock = threading.Lock()
+        # thread id -> collapsed stack counts for the request it's serving
+        self._inflight: Dict[int, CounterT[str]] = {}
+
+    def watch(self) -> None:
+        with self._lock:
+            self._inflight[threading.get_ident()] = Counter()
+
+    def unwatch(self) -> CounterT[str]:
+        with self._lock:
+            return self._inflight.pop(threading.get_ident(), Counter())
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for tid, stacks in self._inflight.items():
+                    frame = frames.get(tid)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# -- summaries of the watched modules
+
+
+def _summarize_stacks(stacks: CounterT[str], n: int = 5) -> List[str]:
+    paths: CounterT[str] = Counter()
+    for stack, count in stacks.items():
+        frames = [f for f in stack.split(";") if f.startswith(watched)]
+        if frames:
+            paths[" > ".join(frames)] += count
+    total = sum(stacks.values()) or 1
+    return [
+        f"{100 * count / total:.0f}% {path}"
+        for path, count in paths.most_common(n)
+    ]
+
+
+def _summarize_profile(stats: pstats.Stats, n: int = 5) -> List[str]:
+    rows = []
+    for (filename, line, func), (_, calls, _, cum, _) in stats.stats.items():
+        module = watched_files.get(os.path.abspath(filename))
+        if module:
+            rows.append((cum, f"{cum * 1000:.1f}ms {module}:{func} x{calls}"))
+    return [row for _, row in sorted(rows, reverse=True)[:n]]
+
+
+# -- dumps
+
+
+def _dump(kind: str, elapsed: float, write, summary: List[str]) -> None:
+    the_dir = profile_dir()
+    os.makedirs(the_dir, exist_ok=True)
+    endpoint = (request.endpoint or "none").replace(".", "-")
+    name = f"{time.time_ns()}-{os.getpid()}-{endpoint}"
+    ext = "prof" if kind == "cprofile" else "txt"
+    write(join(the_dir, f"{name}.{ext}"))
+    meta = {
+        "file": f"{name}.{ext}",
+        "kind": kind,
+        "method": request.method,
+        "path": request.full_path,
+        "ms": elapsed * 1000,
+        "when": time.time(),
+        "summary": summary,
+    }
+    with open(join(the_dir, f"{name}.json"), "w") as f:
+        json.dump(meta, f)
+    _trim(the_dir, _config("SORY_PROFILE_KEEP"))
+
+
+def _trim(the_dir: str, keep: int) -> None:
+    metas = sorted(f for f in os.listdir(the_dir) if f.endswith(".json"))
+    for old in metas[:-keep] if keep else metas:
+        stem = old[: -len(".json")]
+        for ext in (".json", ".prof", ".txt"):
+            try:
+                os.remove(join(the_dir, stem + ext))
+            except FileNotFoundError:
+                pass
+
+
+def dumps() -> List[Dict]:
+    """Newest first."""
+    the_dir = profile_dir()
+    if not exists(the_dir):
+        return []
+    metas = []
+    for f in sorted(os.listdir(the_dir), reverse=True):
+        if f.endswith(".json"):
+            try:
+                with open(join(the_dir, f)) as meta:
+                    metas.append(json.load(meta))
+            except (OSError, ValueError):
+                pass  # trimmed or half-written by another worker
+    return metas
+
+
+# -- admin views
+
+
+@bp.route("/", methods=("GET",))
+def list_profiles():
+    return render_template("sory/profiles.html", profiles=dumps(), errors=[])
+
+
+@bp.route("/<name>", methods=("GET",))
+def get_profile(name):
+    if not name.endswith((".prof", ".txt")):
+        abort(404)
+    return send_from_directory(profile_dir(), name, as_attachment=True)
+
+
+# -- request hooks
+
+
+def init_app(app: Flask) -> None:
+    sample = app.config.get("SORY_PROFILE_SAMPLE", 0.0)
+    slow_ms = app.config.get("SORY_PROFILE_SLOW_MS")
+    if not sample and slow_ms is None:
+        return
+
+    app.register_blueprint(bp)
+
+    interval = app.config.get(
+        "SORY_PROFILE_INTERVAL_MS", defaults["SORY_PROFILE_INTERVAL_MS"]
+    )
+    the_sampler: Optional[sampler] = None
+    starting = threading.Lock()
+
+    def get_sampler() -> sampler:
+        # started lazily so it ends up in the worker, not a forking parent
+        nonlocal the_sampler
+        if the_sampler is None:
+            with starting:
+                if the_sampler is None:
+                    the_sampler = sampler(interval / 1000)
+                    the_sampler.start()
+        return the_sampler
+
+    @app.before_request
+    def start_profiling() -> None:
+        g.sory_profile_started = time.perf_counter()
+        if sample and random.random() < sample:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                pass  # some other profiler is active
+            else:
+                g.sory_profile = profile
+        if slow_ms is not None:
+            get_sampler().watch()
+
+    @app.teardown_request
+    def stop_profiling(exc) -> None:
+        started = g.pop("sory_profile_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+
+        profile = g.pop("sory_profile", None)
+        if profile is not None:
+            profile.disable()
+            stats = pstats.Stats(profile)
+            _dump(
+                "cprofile",
+                elapsed,
+                stats.dump_stats,
+                _summarize_profile(stats),
+            )
+
+        if slow_ms is not None:
+            stacks = get_sampler().unwatch()
+            if elapsed * 1000 >= slow_ms and stacks:
+
+                def write(path: str) -> None:
+                    with open(path, "w") as f:
+                        for stack, count in stacks.most_common():
+                            f.write(f"{stack} {count}\n")
+
+                _dump("slow", elapsed, write, _summarize_stacks(stacks))
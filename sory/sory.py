@@ -1,9 +1,10 @@
 from flask import (
     Blueprint,
-    render_template,
     request,  # flash, g, redirect, url_for
 )
 from . import model
+from . import pagecache
+from .metrics import render_template
 
 bp = Blueprint("sory", __name__)
 
@@ -11,15 +12,69 @@ bp = Blueprint("sory", __name__)
 @bp.route("/", methods=("GET",))
 def sory():
     board = None
+    matches = None
     errors = []
 
-    board_name = request.args.get("board")
+    # anything besides the board is a front matter filter,
+    # like ?board=x&assignee=bob&priority=high
+    filters = request.args.to_dict(flat=False)
+    board_name = filters.pop("board", [None])[0]
+
+    generation = model.generation.value
+    key = (board_name, tuple(sorted(request.args.items(multi=True))))
+    page = pagecache.get(generation, key)
+    if page is not None:
+        return page
     if board_name:
         try:
             board = model.get_board(board_name)
+            if filters:
+                matches = board.query(filters)
         except ValueError as e:
             errors.append(str(e))
 
+    html = render_template(
+        "sory/sory.html",
+        boards=model.boards,
+        board=board,
+        matches=matches,
+        errors=errors,
+    )
+    if errors:
+        return html
+    return pagecache.put(generation, key, html)
+
+
+history_page = 20
+
+
+@bp.route(
+    "/board/<board_name>/column/<column_name>/card/<card_name>/history",
+    methods=("GET",),
+)
+def card_history(board_name, column_name, card_name):
+    board = None
+    card = None
+    revisions = []
+    errors = []
+
+    page = request.args.get("page", 0, type=int)
+
+    try:
+        board = model.get_board(board_name)
+        card = board.get_column(column_name).get_card(card_name)
+        revisions = card.history(page * history_page, history_page)
+    except ValueError as e:
+        errors.append(str(e))
+
     return render_template(
-        "sory/sory.html", boards=model.boards, board=board, errors=errors
+        "sory/history.html",
+        boards=model.boards,
+        board=board,
+        card=card,
+        column_name=column_name,
+        revisions=revisions,
+        page=page,
+        more=card is not None and card.n_revisions > (page + 1) * history_page,
+        errors=errors,
     )
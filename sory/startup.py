@@ -0,0 +1,130 @@
+"""
+How long does a fresh sory take to serve its first page?
+
+    python -m sory.startup --runs 10 --boards 4
+
+Seeds a throwaway instance folder, then starts sory on it --runs times,
+each in a new interpreter, timing `import sory`, create_app, and the
+first GET / separately. Prints the median of each. --preload sets
+SORY_PRELOAD, which moves the repo and index loading out of the first
+request and into create_app; --set hands the app any other config, e.g.
+--set SORY_REPO_PER_BOARD=true.
+"""
+from typing import Dict, List, Optional
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from .loadtest import parse_setting
+
+
+stages = ("import", "create_app", "first_request")
+
+# runs in the fresh interpreter: instance path, config json, board name
+_child = """
+import json, sys, time
+started = time.perf_counter()
+from sory import create_app
+imported = time.perf_counter()
+app = create_app(json.loads(sys.argv[2]), instance_path=sys.argv[1])
+created = time.perf_counter()
+app.test_client().get("/", query_string={"board": sys.argv[3]})
+served = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first_request": served - created,
+    "git_at_startup": "git" in sys.modules,
+}))
+"""
+
+
+def seed(
+    instance_path: str, config: Dict[str, object], n_boards: int
+) -> List[str]:
+    from . import create_app
+
+    client = create_app(config, instance_path=instance_path).test_client()
+    boards = [f"start{c}" for c in "abcdefghijklmnopqrstuvwxyz"[:n_boards]]
+    for b in boards:
+        client.post("/boards/create", data={"name": b})
+        for col in ("todo", "doing", "done"):
+            client.post(f"/board/{b}/create", data={"name": col})
+            for i in range(5):
+                client.post(
+                    f"/board/{b}/column/{col}/create",
+                    data={"name": f"card {i}"},
+                )
+    return boards
+
+
+def run_once(
+    instance_path: str, config: Dict[str, object], board_name: str
+) -> Dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-c", _child, instance_path, json.dumps(config)]
+        + [board_name],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m sory.startup", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--boards", type=int, default=4)
+    parser.add_argument("--preload", action="store_true")
+    parser.add_argument(
+        "--set",
+        dest="config",
+        type=parse_setting,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="App config for the throwaway instance. Values are JSON.",
+    )
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = dict(args.config)
+    if args.preload:
+        config["SORY_PRELOAD"] = True
+
+    instance_path = tempfile.mkdtemp(prefix="sory-startup-")
+    try:
+        boards = seed(instance_path, config, args.boards)
+        runs = [
+            run_once(instance_path, config, boards[0])
+            for _ in range(args.runs)
+        ]
+    finally:
+        shutil.rmtree(instance_path, ignore_errors=True)
+
+    report = {
+        stage: 1000 * statistics.median(r[stage] for r in runs)
+        for stage in stages
+    }
+    report["total"] = sum(report[stage] for stage in stages)
+    report["git_at_startup"] = any(r["git_at_startup"] for r in runs)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for stage in stages + ("total",):
+            print(f"{stage:<16}{report[stage]:>10.1f}ms")
+        if report["git_at_startup"]:
+            print("GitPython was imported before the first request.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
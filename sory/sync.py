@@ -0,0 +1,90 @@
+"""
+Cross-process coordination for gunicorn-style worker pools.
+
+`FileLock` is an fcntl lock on a file, so it excludes other threads and
+other processes alike: every acquisition opens its own file description,
+and flock conflicts between descriptions even inside one process.
+
+`Generation` is an 8-byte counter in a memory-mapped file. Writers bump
+it after every commit, and anyone can read it for the price of a memory
+load, so in-process caches can tell when another worker has written
+without asking git.
+"""
+from typing import ContextManager, Generator
+
+from contextlib import contextmanager
+import fcntl
+import mmap
+import os
+import struct
+
+
+counter = struct.Struct("<Q")
+
+
+def _ensure_file(path: str, size: int = 0) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+class FileLock:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        _ensure_file(path)
+
+    @contextmanager
+    def _hold(self, how: int) -> Generator[None, None, None]:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, how)
+            yield
+        finally:
+            # closing the descriptor drops the flock too, but be explicit
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def exclusive(self) -> ContextManager[None]:
+        return self._hold(fcntl.LOCK_EX)
+
+    def shared(self) -> ContextManager[None]:
+        return self._hold(fcntl.LOCK_SH)
+
+    @contextmanager
+    def attempt(self) -> Generator[bool, None, None]:
+        """Non-blocking exclusive hold. Yields whether we got it."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+            else:
+                yield True
+        finally:
+            os.close(fd)
+
+
+class Generation:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        _ensure_file(path, counter.size)
+        # writers to different boards hold different write locks, so the
+        # counter brings its own
+        self._lock = FileLock(path)
+        with open(path, "r+b") as f:
+            self._map = mmap.mmap(f.fileno(), counter.size)
+
+    @property
+    def value(self) -> int:
+        return counter.unpack_from(self._map)[0]
+
+    def bump(self) -> int:
+        with self._lock.exclusive():
+            value = self.value + 1
+            counter.pack_into(self._map, 0, value)
+        return value
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from sory import asgi
+
+
+def _scope(path="/", query=b""):
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query,
+        "headers": [(b"accept", b"text/html")],
+    }
+
+
+async def _get(app, scope):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"], b"".join(m.get("body", b"") for m in sent)
+
+
+def test_runs_wsgi_app_on_pool():
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        thread = threading.current_thread().name
+        return [f"{environ['QUERY_STRING']} {thread}".encode()]
+
+    app = asgi.bridge(wsgi_app, threads=2, queue=0)
+    status, body = asyncio.run(_get(app, _scope(query=b"board=x")))
+    assert status == 200
+    assert body.startswith(b"board=x sory")
+
+
+def test_backpressure():
+    release = threading.Event()
+
+    def wsgi_app(environ, start_response):
+        release.wait(5)
+        start_response("200 OK", [])
+        return [b"ok"]
+
+    app = asgi.bridge(wsgi_app, threads=1, queue=1)
+
+    async def main():
+        busy = [asyncio.ensure_future(_get(app, _scope())) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        turned_away = await _get(app, _scope())
+        release.set()
+        return turned_away, await asyncio.gather(*busy)
+
+    (status, _), served = asyncio.run(main())
+    assert status == 503
+    assert [s for s, _ in served] == [200, 200]
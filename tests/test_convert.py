@@ -0,0 +1,22 @@
+from sory import convert
+
+
+def test_front_matter():
+    card = "---\nassignee: bob\ndue: 2020-05-01 10:00\n---\n# hi\n"
+    assert convert.front_matter(card) == {
+        "assignee": "bob",
+        "due": "2020-05-01 10:00",
+    }
+
+
+def test_no_front_matter():
+    assert convert.front_matter("") == {}
+    assert convert.front_matter("# hi\n\nthere\n") == {}
+
+
+def test_preview():
+    card = "---\na: b\n---\n# The *title*\nsome `text`\n\n [x] one\n [ ] two\n"
+    p = convert.preview(card, 9)
+    assert p.title == "The title"
+    assert p.text == "some text"
+    assert (p.done, p.total) == (1, 2)
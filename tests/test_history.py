@@ -0,0 +1,143 @@
+import threading
+
+import git
+
+from sory import create_app, history, model
+
+
+def _commit(repo, root, name, content):
+    (root / name).write_text(content)
+    repo.index.add([name])
+    return repo.index.commit(f"Update card {name}.")
+
+
+def test_record_and_backfill_agree(tmp_path):
+    root = tmp_path / "repo"
+    repo = git.Repo.init(root)
+    log = str(tmp_path / "history.log")
+
+    _commit(repo, root, "a.md", "one")
+    _commit(repo, root, "b.md", "one")
+    history.rebuild(repo, log)
+
+    # appended as commits happen
+    last = _commit(repo, root, "a.md", "two")
+    history.record(repo, log, last)
+    assert history.count(log, "a.md") == 2
+    assert history.count(log, "b.md") == 1
+
+    newest, oldest = history.revisions(repo, log, "a.md", 0, 10)
+    assert newest.sha == last.hexsha
+    assert "+two" in newest.diff
+    assert "+one" in oldest.diff
+
+    appended = open(log).read()
+    history.rebuild(repo, log)
+    assert open(log).read() == appended
+
+
+def test_record_rebuilds_when_out_of_step(tmp_path):
+    root = tmp_path / "repo"
+    repo = git.Repo.init(root)
+    log = str(tmp_path / "history.log")
+
+    _commit(repo, root, "a.md", "one")
+    # nobody told the log about that one
+    last = _commit(repo, root, "a.md", "two")
+    history.record(repo, log, last)
+    assert history.count(log, "a.md") == 2
+
+
+def test_concurrent_readers_see_appends_once(tmp_path):
+    log = str(tmp_path / "history.log")
+    with open(log, "w") as f:
+        f.write("0 a.md\n")
+    assert history.count(log, "a.md") == 1
+
+    with open(log, "a") as f:
+        f.writelines(f"{i} a.md\n" for i in range(1, 20001))
+    counts = []
+    barrier = threading.Barrier(8)
+
+    def read():
+        barrier.wait()
+        counts.append(history.count(log, "a.md"))
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counts == [20001] * 8
+
+
+def test_card_history_alongside_writes(tmp_path):
+    app = create_app({"TESTING": True}, instance_path=str(tmp_path))
+    with app.app_context():
+        k = model.add_board("abc").add_column("todo").add_card("one")
+        for i in range(5):
+            k.content = f"edit {i}"
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        with app.app_context():
+            try:
+                while not stop.is_set():
+                    for rev in k.history(0, 20):
+                        assert rev.diff
+            except Exception as e:
+                errors.append(e)
+
+    def write(n):
+        with app.app_context():
+            try:
+                for i in range(20):
+                    k.content = f"writer {n} edit {i}"
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read, daemon=True) for _ in range(4)]
+    writers = [
+        threading.Thread(target=write, args=(n,), daemon=True)
+        for n in range(2)
+    ]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join(timeout=20)
+    stop.set()
+    for t in readers:
+        t.join(timeout=10)
+
+    # these used to wedge the repo's shared cat-file pipe for good
+    assert not any(t.is_alive() for t in readers + writers)
+    assert not errors
+    with app.app_context():
+        assert k.n_revisions == 46
+        newest = k.history(0, 1)[0]
+    assert newest.message.startswith("Update card one.")
+    assert "+writer" in newest.diff
+
+
+def test_unchanged_save_makes_no_commit(tmp_path, monkeypatch):
+    app = create_app({"TESTING": True}, instance_path=str(tmp_path))
+    with app.app_context():
+        k = model.add_board("abc").add_column("todo").add_card("one")
+        k.content = "same"
+        n_revisions = k.n_revisions
+        head = git.Repo(tmp_path).head.commit
+        generation = model.generation.value
+
+        rebuilds = []
+        monkeypatch.setattr(
+            history, "rebuild", lambda *args: rebuilds.append(args)
+        )
+        k.content = "same"
+        assert git.Repo(tmp_path).head.commit == head
+        assert model.generation.value == generation
+
+        # so the log still ends at HEAD, and the next edit just appends
+        k.content = "different"
+        assert not rebuilds
+        assert k.n_revisions == n_revisions + 1
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import git
+
+from sory import create_app, history, maint, model
+
+
+def _commit(repo, root, name, content, when):
+    (root / name).write_text(content)
+    repo.index.add([name])
+    date = f"{int(when.timestamp())} +0000"
+    return repo.index.commit(
+        f"Update card {name}.", author_date=date, commit_date=date
+    )
+
+
+def _first_parents(repo):
+    return list(repo.iter_commits("HEAD", first_parent=True))[::-1]
+
+
+def test_squash_old_same_day_edits(tmp_path):
+    repo = git.Repo.init(tmp_path)
+    now = datetime.now(timezone.utc).replace(hour=12)
+    day1, day2 = now - timedelta(days=10), now - timedelta(days=9)
+
+    for i in range(3):
+        _commit(repo, tmp_path, "a.md", f"a{i}", day1 + timedelta(minutes=i))
+    _commit(repo, tmp_path, "b.md", "b0", day1 + timedelta(minutes=5))
+    for i in range(2):
+        when = day2 + timedelta(minutes=i)
+        _commit(repo, tmp_path, "a.md", f"a{i + 3}", when)
+    newest = _commit(repo, tmp_path, "a.md", "a5", now - timedelta(hours=1))
+    old_head = repo.head.commit
+
+    app = create_app({"TESTING": True}, instance_path=str(tmp_path))
+    with app.app_context():
+        log = model.history_log(str(tmp_path))
+        history.rebuild(repo, log)
+        assert history.count(log, "a.md") == 6
+
+        # first pass only reaches day 1
+        stats = maint.maintain(squash_after_days=9.5)
+        assert stats["repos"][0]["squashed"] == 2
+        squashed_day1, b0 = _first_parents(repo)[:2]
+        assert squashed_day1.message.startswith("Squash 3 edits.")
+        head = repo.head.commit.hexsha
+        assert maint._settled(repo, head) == squashed_day1.hexsha
+
+        # then day 2, starting where the first pass left off
+        stats = maint.maintain(squash_after_days=5)
+        assert stats["repos"][0]["squashed"] == 1
+        commits = _first_parents(repo)
+        assert commits[:2] == [squashed_day1, b0]
+        assert len(commits) == 4
+        assert commits[2].message.startswith("Squash 2 edits.")
+        assert maint._settled(repo, commits[-1].hexsha) == b0.hexsha
+
+        # newer commits are replayed with their trees untouched
+        replayed = commits[-1]
+        assert replayed.hexsha != newest.hexsha
+        assert replayed.tree == newest.tree
+        assert replayed.message == newest.message
+        assert not repo.index.diff(None)
+
+        # nothing lost: every pass tagged the head it rewrote
+        tagged = {t.commit for t in repo.tags if t.name.startswith("audit/")}
+        assert old_head in tagged
+        assert len(tagged) == 2
+
+        # and the card history index follows the new shas
+        assert history.count(log, "a.md") == 3
+        assert history._tip(log) == replayed.hexsha
+
+
+def test_squash_ignores_index_churn(tmp_path):
+    repo = git.Repo.init(tmp_path)
+    (tmp_path / "todo").mkdir()
+    day = datetime.now(timezone.utc).replace(hour=12) - timedelta(days=10)
+
+    # only some of the edits changed the preview
+    for i, preview in enumerate([True, False, True, False]):
+        if preview:
+            (tmp_path / "todo" / ".index").write_text(f"preview {i}")
+            repo.index.add(["todo/.index"])
+        when = day + timedelta(minutes=i)
+        _commit(repo, tmp_path, "todo/a.md", f"a{i}", when)
+
+    app = create_app({"TESTING": True}, instance_path=str(tmp_path))
+    with app.app_context():
+        stats = maint.maintain(squash_after_days=5)
+    assert stats["repos"][0]["squashed"] == 3
+    (squashed,) = _first_parents(repo)
+    assert squashed.message.startswith("Squash 4 edits.")
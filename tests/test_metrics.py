@@ -0,0 +1,44 @@
+from sory import metrics
+
+
+def test_histogram_exposition():
+    h = metrics.histogram("test_seconds", "Just a test.", (0.1, 1))
+    h.observe(0.05, stage="a")
+    h.observe(0.5, stage="a")
+    h.observe(5, stage="a")
+
+    lines = h.expose().splitlines()
+    assert lines[:2] == [
+        "# HELP test_seconds Just a test.",
+        "# TYPE test_seconds histogram",
+    ]
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+    metrics.registry.remove(h)
+
+
+def test_timed_generator_counts_partial_consumption():
+    seconds = metrics.histogram("test_gen_seconds", "Test.", (1,))
+    count = metrics.histogram("test_gen_items", "Test.", (1, 10))
+
+    @metrics.timed_generator(seconds, count, stage="x")
+    def gen():
+        yield from range(100)
+
+    it = gen()
+    assert [next(it) for _ in range(3)] == [0, 1, 2]
+    it.close()
+    assert 'test_gen_items_sum{stage="x"} 3.0' in count.expose()
+    metrics.registry.remove(seconds)
+    metrics.registry.remove(count)
+
+
+def test_render_time_per_view(tmp_path):
+    from sory import create_app
+
+    app = create_app({"TESTING": True}, instance_path=str(tmp_path))
+    app.test_client().get("/")
+    page = app.test_client().get("/metrics").data.decode()
+    assert 'sory_render_seconds_count{view="sory.sory"}' in page
@@ -0,0 +1,233 @@
+import os
+import threading
+
+import git
+
+from sory import create_app, model
+
+
+def _app(tmp_path, **config):
+    return create_app(
+        dict(TESTING=True, **config), instance_path=str(tmp_path)
+    )
+
+
+def test_state_waits_for_first_use(tmp_path):
+    app = _app(tmp_path)
+    assert "sory_model" not in app.extensions
+    assert not (tmp_path / ".sory").exists()
+
+    client = app.test_client()
+    client.post("/boards/create", data={"name": "abc"})
+    client.post("/board/abc/create", data={"name": "todo"})
+    assert b"todo" in client.get("/?board=abc").data
+    with app.app_context():
+        assert model.generation.value == 2
+        assert [b.name for b in model.boards] == ["abc"]
+
+
+def test_preload(tmp_path):
+    _app(tmp_path).test_client().post("/boards/create", data={"name": "abc"})
+
+    app = _app(tmp_path, SORY_PRELOAD=True)
+    state = app.extensions["sory_model"]
+    assert list(state.repos) == [str(tmp_path)]
+    assert set(state.caches["meta"]) == {str(tmp_path / "abc")}
+
+
+# -- SORY_REPO_PER_BOARD
+
+
+def test_sharded_boards_get_own_repos_and_locks(tmp_path):
+    app = _app(tmp_path, SORY_REPO_PER_BOARD=True)
+    with app.app_context():
+        abc, xyz = model.add_board("abc"), model.add_board("xyz")
+
+        assert not (tmp_path / ".git").exists()
+        for b in (abc, xyz):
+            assert git.Repo(b.path).working_tree_dir == b.path
+            assert model.repo_root(os.path.join(b.path, "todo")) == b.path
+        assert model.repo_for(abc.path) is not model.repo_for(xyz.path)
+
+        locks = {model.lock_for(b.path).path for b in (abc, xyz)}
+        assert locks == {
+            str(tmp_path / ".sory" / "locks" / "abc.lock"),
+            str(tmp_path / ".sory" / "locks" / "xyz.lock"),
+        }
+        assert model.lock.path not in locks
+
+        assert (tmp_path / ".sory" / "boards").read_text() == "abc\nxyz\n"
+        assert [b.name for b in model.boards] == ["abc", "xyz"]
+
+
+def test_sharded_board_listed_before_generation_moves(tmp_path):
+    with _app(tmp_path, SORY_REPO_PER_BOARD=True).app_context():
+        model.add_board("xyz")
+        generation = model.generation
+        listed = []
+        bump = generation.bump
+
+        def bump_and_look():
+            listed.append([b.name for b in model.boards])
+            return bump()
+
+        generation.bump = bump_and_look
+        model.add_board("abc")
+        assert listed == [["xyz", "abc"]]
+
+
+def test_sharded_registry_backfills_from_disk(tmp_path):
+    with _app(tmp_path, SORY_REPO_PER_BOARD=True).app_context():
+        model.add_board("xyz")
+        model.add_board("abc")
+    (tmp_path / ".sory" / "boards").unlink()
+
+    with _app(tmp_path, SORY_REPO_PER_BOARD=True).app_context():
+        assert [b.name for b in model.boards] == ["abc", "xyz"]
+        model.add_board("def")
+        assert [b.name for b in model.boards] == ["abc", "xyz", "def"]
+    assert (tmp_path / ".sory" / "boards").read_text() == "abc\nxyz\ndef\n"
+
+
+def test_sharded_concurrent_commits(tmp_path):
+    app = _app(tmp_path, SORY_REPO_PER_BOARD=True)
+    with app.app_context():
+        boards = [model.add_board(name) for name in ("abc", "def", "xyz")]
+    errors = []
+
+    def add_columns(b, prefix):
+        with app.app_context():
+            try:
+                for i in range(10):
+                    b.add_column(f"{prefix}{i}")
+            except Exception as e:
+                errors.append(e)
+
+    threads = [
+        threading.Thread(target=add_columns, args=(b, prefix))
+        for b in boards
+        for prefix in ("todo", "done")
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    for b in boards:
+        # the board itself, then a commit per column
+        assert len(list(git.Repo(b.path).iter_commits())) == 21
+    with app.app_context():
+        assert model.generation.value == 63
+
+
+# -- previews
+
+
+def _commits(path):
+    return len(list(git.Repo(path).iter_commits()))
+
+
+def test_previews_backfill_cards_from_before(tmp_path):
+    with _app(tmp_path).app_context():
+        col = model.add_board("abc").add_column("todo")
+        one, two = col.add_card("one"), col.add_card("two")
+        one.content = "# One\nfirst"
+        two.content = "# Two\nsecond"
+
+    # as if both were written before there were previews
+    open(col.index_path, "w").close()
+    repo = git.Repo(tmp_path)
+    repo.git.add("--", col.index_path)
+    repo.index.commit("Old column.")
+
+    app = _app(tmp_path)
+    with app.app_context():
+        # an edit indexes just that card...
+        one.content = "# One\nfirst, again"
+        n_commits = _commits(tmp_path)
+        # ...and the first look fills in the rest, in a commit of its own
+        previews = col.previews
+        assert previews["two"]["title"] == "Two"
+        assert previews["one"]["text"] == "first, again"
+        assert _commits(tmp_path) == n_commits + 1
+
+
+def test_previews_backfill_only_once(tmp_path):
+    app = _app(tmp_path)
+    with app.app_context():
+        col = model.add_board("abc").add_column("todo")
+        col.add_card("one").content = "# One"
+        col.add_card("empty")
+        n_commits = _commits(tmp_path)
+        generation = model.generation.value
+
+        # nothing missing, say because another worker just did it
+        col._backfill_previews()
+        assert set(col.previews) == {"one"}
+        assert _commits(tmp_path) == n_commits
+        assert model.generation.value == generation
+
+
+# -- front matter index
+
+
+def _status(path):
+    return git.Repo(path).git.status("--porcelain", "--", "abc")
+
+
+def test_meta_follows_card_edits(tmp_path):
+    with _app(tmp_path).app_context():
+        b = model.add_board("abc")
+        assert b.meta == {}
+        one = b.add_column("todo").add_card("one")
+
+        one.content = "---\nassignee: Bob\n---\n# One\n"
+        assert b.meta == {"todo/one": {"assignee": "Bob"}}
+        one.content = "# One\n"
+        assert b.meta == {}
+        assert not _status(tmp_path)
+
+
+def test_meta_backfill_commits_on_its_own(tmp_path):
+    with _app(tmp_path).app_context():
+        b = model.add_board("abc")
+        b.add_column("todo").add_card("one").content = "---\na: b\n---\n"
+    # as if the board was from before there was an index
+    repo = git.Repo(tmp_path)
+    repo.index.remove([b.meta_path], working_tree=True)
+    repo.index.commit("Old board.")
+
+    with _app(tmp_path).app_context():
+        assert b.meta == {"todo/one": {"a": "b"}}
+        assert repo.head.commit.message == "Board abc front matter index."
+        assert not _status(tmp_path)
+
+        # so it doesn't sneak into some other commit later
+        b.add_column("done")
+        assert list(repo.head.commit.stats.files) == ["abc/done/.index"]
+
+
+def test_query_and_filtered_view(tmp_path):
+    app = _app(tmp_path)
+    with app.app_context():
+        b = model.add_board("abc")
+        todo = b.add_column("todo")
+        todo.add_card("one").content = "---\nassignee: Bob\npri: high\n---\n"
+        todo.add_card("two").content = "---\nassignee: alice\n---\n"
+        todo.add_card("three").content = "no front matter"
+
+        assert b.query({"assignee": ["bob"]}) == {"todo/one"}
+        assert b.query({"assignee": ["BOB", "Alice"]}) == {
+            "todo/one",
+            "todo/two",
+        }
+        assert b.query({"assignee": ["bob"], "pri": ["low"]}) == set()
+        assert b.query({}) == {"todo/one", "todo/two"}
+
+    page = app.test_client().get("/?board=abc&assignee=BOB").data
+    assert b"/card/one/history" in page
+    assert b"/card/two/history" not in page
+    assert b"/card/three/history" not in page
+    page = app.test_client().get("/?board=abc").data
+    assert b"/card/three/history" in page
@@ -0,0 +1,30 @@
+import gzip
+
+from sory import pagecache
+
+
+def test_encodings_roundtrip():
+    body = b"<p>hi</p>" * 100
+    encodings = pagecache.encode(body)
+    assert encodings["identity"] == body
+    assert gzip.decompress(encodings["gzip"]) == body
+
+
+def test_lru_and_generations():
+    page = b"x" * 1000
+    size = sum(len(b) for b in pagecache.encode(page).values())
+    cache = pagecache.page_cache(2 * size)
+
+    cache.put(1, "a", page)
+    cache.put(1, "b", page)
+    assert cache.get(1, "a") is not None
+    cache.put(1, "c", page)
+    # b was least recently used
+    assert cache.get(1, "b") is None
+    assert cache.get(1, "a") is not None
+
+    # a newer generation empties it, and stale ones can't come back
+    assert cache.get(2, "a") is None
+    cache.put(1, "a", page)
+    assert cache.get(2, "a") is None
+    assert cache.n_bytes == 0
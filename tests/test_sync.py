@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+
+from sory import sync
+
+
+def _bump_many(lock_path, gen_path, n):
+    lock = sync.FileLock(lock_path)
+    generation = sync.Generation(gen_path)
+    for _ in range(n):
+        with lock.exclusive():
+            generation.bump()
+
+
+def test_generation_shared_between_processes(tmp_path):
+    lock_path = str(tmp_path / "write.lock")
+    gen_path = str(tmp_path / "generation")
+    generation = sync.Generation(gen_path)
+    assert generation.value == 0
+
+    procs = [
+        multiprocessing.Process(
+            target=_bump_many, args=(lock_path, gen_path, 200)
+        )
+        for _ in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    # no lost updates means the lock excluded the other workers
+    assert generation.value == 800
+
+
+def test_bumps_add_up_under_different_locks(tmp_path):
+    # like writers to different boards, each holding only its own lock
+    gen_path = str(tmp_path / "generation")
+    procs = [
+        multiprocessing.Process(
+            target=_bump_many,
+            args=(str(tmp_path / f"board{i}.lock"), gen_path, 5000),
+        )
+        for i in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    assert sync.Generation(gen_path).value == 20000
+
+
+def test_attempt_is_exclusive(tmp_path):
+    lock = sync.FileLock(str(tmp_path / "maint.lock"))
+    with lock.attempt() as got:
+        assert got
+        with lock.attempt() as got_again:
+            assert not got_again
+    assert os.path.exists(lock.path)